@@ -5,6 +5,8 @@ from uuid import UUID, uuid4
 from datetime import datetime
 from pydantic import BaseModel, Field
 
+from .types import InternedStr
+
 
 class AddressBase(BaseModel):
     id: UUID = Field(
@@ -17,12 +19,12 @@ class AddressBase(BaseModel):
         description="Street address and number.",
         json_schema_extra={"example": "123 Main St"},
     )
-    city: str = Field(
+    city: InternedStr = Field(
         ...,
         description="City or locality.",
         json_schema_extra={"example": "New York"},
     )
-    state: Optional[str] = Field(
+    state: Optional[InternedStr] = Field(
         None,
         description="State/region code if applicable.",
         json_schema_extra={"example": "NY"},
@@ -32,7 +34,7 @@ class AddressBase(BaseModel):
         description="Postal or ZIP code.",
         json_schema_extra={"example": "10001"},
     )
-    country: str = Field(
+    country: InternedStr = Field(
         ...,
         description="Country name or ISO label.",
         json_schema_extra={"example": "USA"},
@@ -3,11 +3,13 @@ from uuid import UUID, uuid4
 from datetime import datetime
 from typing import Optional
 
+from .types import InternedStr
+
 class CourseBase(BaseModel):
     code: str = Field(..., example="COMS4153", description="Course code")
     title: str = Field(..., example="Cloud Computing", description="Course title")
-    instructor: str = Field(..., example="Prof. Ferguson", description="Instructor name")
-    semester: str = Field(..., example="Fall 2025", description="Semester/term")
+    instructor: InternedStr = Field(..., example="Prof. Ferguson", description="Instructor name")
+    semester: InternedStr = Field(..., example="Fall 2025", description="Semester/term")
 
 # Removed id from here
 class CourseCreate(CourseBase):
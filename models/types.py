@@ -0,0 +1,8 @@
+import sys
+from typing import Annotated
+
+from pydantic import AfterValidator
+
+# Low-cardinality labels (semesters, instructors, countries, ...) are interned so
+# equal values share one str object and compare/hash-lookup by identity.
+InternedStr = Annotated[str, AfterValidator(sys.intern)]
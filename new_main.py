@@ -3,10 +3,15 @@ from __future__ import annotations
 import os
 import socket
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import lru_cache
+from itertools import count
+from collections import defaultdict
+from typing import Any, Callable, DefaultDict, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
 from uuid import UUID
 
-from fastapi import FastAPI, HTTPException, Query, Path
+import orjson
+from fastapi import FastAPI, Header, HTTPException, Query, Path, Response
+from pydantic import BaseModel
 
 
 from models.person import PersonCreate, PersonRead, PersonUpdate
@@ -17,96 +22,203 @@ from models.health import Health
 from models.course import CourseCreate, CourseRead, CourseUpdate
 from models.assignment import AssignmentCreate, AssignmentRead, AssignmentUpdate
 
+from utils.indexes import index_add, index_lookup, index_remove, make_index
+from utils.msgpack_response import VARY_ACCEPT, msgpack_response, wants_msgpack
+from utils.orjson_request import ORJSONRoute
+from utils.orjson_response import (
+    ORJSONResponse,
+    Rendered,
+    json_array_response,
+    render_model,
+    rendered_response,
+)
+
 port = int(os.environ.get("FASTAPIPORT", 8000))
 
-persons: Dict[UUID, PersonRead] = {}
-addresses: Dict[UUID, AddressRead] = {}
+persons: Dict[int, PersonRead] = {}
+addresses: Dict[int, AddressRead] = {}
+
+# each record's JSON and ETag, rendered on write and served as-is by the read endpoints
+person_json: Dict[int, Rendered] = {}
+address_json: Dict[int, Rendered] = {}
+
+# creation sequence numbers, so index hits can be listed in insertion order like the stores
+_sequence = count()
+person_seq: Dict[int, int] = {}
+address_seq: Dict[int, int] = {}
+
+# secondary indexes for the equality filters on list_persons / list_addresses
+person_index = make_index("uni", "email", "city", "country")
+address_index = make_index("city", "state", "postal_code", "country")
 
 # NEW in-memory stores
-courses: Dict[UUID, CourseRead] = {}
-assignments: Dict[UUID, AssignmentRead] = {}
+# all stores and indexes are keyed by UUID.int: hashing/comparing a plain int is
+# much cheaper than going through UUID.__hash__/__eq__ on every lookup
+courses: Dict[int, CourseRead] = {}
+assignments: Dict[int, AssignmentRead] = {}
+course_json: Dict[int, Rendered] = {}
+course_seq: Dict[int, int] = {}
+assignment_json: Dict[int, Rendered] = {}
+assignment_seq: Dict[int, int] = {}
+
+# (code, semester) -> course id, enforces course uniqueness without a scan
+course_unique: Dict[Tuple[str, str], int] = {}
+course_index = make_index("code", "semester", "instructor")
+# course id -> ids of its assignments, for cascade deletes and course_id filtering
+assignments_by_course: DefaultDict[int, Set[int]] = defaultdict(set)
 
 app = FastAPI(
     title="Person/Address/Health/Course/Assignment API",
     description="Demo FastAPI app using Pydantic v2 models for Person, Address, Health, Course, Assignment",
     version="0.2.0",
+    default_response_class=ORJSONResponse,
 )
+app.router.route_class = ORJSONRoute
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+def apply_update(record: ModelT, newvals: Dict[str, Any]) -> ModelT:
+    """Return a copy of record with newvals applied; only the changed fields are validated."""
+    updated = record.model_copy()
+    for field, value in newvals.items():
+        updated.__pydantic_validator__.validate_assignment(updated, field, value)
+    return updated
+
+def select(
+    store: Dict[int, ModelT], keys: Iterable[int], preds: List[Callable[[ModelT], bool]]
+) -> List[int]:
+    """Keep the keys whose record matches every predicate, in a single pass."""
+    if not preds:
+        return list(keys)
+    return [k for k in keys if all(pred(store[k]) for pred in preds)]
+
+def person_index_keys(person: PersonRead) -> Dict[str, set]:
+    return {
+        "uni": {person.uni},
+        "email": {person.email},
+        "city": {addr.city for addr in person.addresses},
+        "country": {addr.country for addr in person.addresses},
+    }
+
+def address_index_keys(address: AddressRead) -> Dict[str, set]:
+    return {
+        "city": {address.city},
+        "state": {address.state},
+        "postal_code": {address.postal_code},
+        "country": {address.country},
+    }
+
+def course_index_keys(course: CourseRead) -> Dict[str, set]:
+    return {
+        "code": {course.code},
+        "semester": {course.semester},
+        "instructor": {course.instructor},
+    }
+
+@lru_cache(maxsize=1)
+def _local_ip() -> str:
+    # the host's address doesn't change while the process runs; resolve it once
+    return socket.gethostbyname(socket.gethostname())
+
 def make_health(echo: Optional[str], path_echo: Optional[str] = None) -> Health:
     return Health(
         status=200,
         status_message="OK",
         timestamp=datetime.utcnow().isoformat() + "Z",
-        ip_address=socket.gethostbyname(socket.gethostname()),
+        ip_address=_local_ip(),
         echo=echo,
         path_echo=path_echo,
     )
 
 @app.get("/health", response_model=Health, tags=["health"])
-def get_health_no_path(echo: str | None = Query(None, description="Optional echo string")):
+async def get_health_no_path(echo: str | None = Query(None, description="Optional echo string")):
     # Works because path_echo is optional in the model
     return make_health(echo=echo, path_echo=None)
 
 @app.get("/health/{path_echo}", response_model=Health, tags=["health"])
-def get_health_with_path(
+async def get_health_with_path(
     path_echo: str = Path(..., description="Required echo in the URL path"),
     echo: str | None = Query(None, description="Optional echo string"),
 ):
     return make_health(echo=echo, path_echo=path_echo)
 
 @app.post("/addresses", response_model=AddressRead, status_code=201, tags=["addresses"])
-def create_address(address: AddressCreate):
-    if address.id in addresses:
+async def create_address(address: AddressCreate):
+    key = address.id.int
+    if key in addresses:
         raise HTTPException(status_code=400, detail="Address with this ID already exists")
-    addresses[address.id] = AddressRead(**address.model_dump())
-    return addresses[address.id]
-
-@app.get("/addresses", response_model=List[AddressRead], tags=["addresses"])
-def list_addresses(
+    # AddressCreate is already validated; don't pay for a second validation pass
+    now = datetime.utcnow()
+    record = AddressRead.model_construct(**address.model_dump(), created_at=now, updated_at=now)
+    addresses[key] = record
+    address_json[key] = render_model(record)
+    address_seq[key] = next(_sequence)
+    index_add(address_index, key, address_index_keys(record))
+    return rendered_response(address_json[key], status_code=201)
+
+@app.get("/addresses", responses={200: {"model": List[AddressRead], "content": {"application/x-msgpack": {}}}}, tags=["addresses"])
+async def list_addresses(
     street: Optional[str] = Query(None, description="Filter by street"),
     city: Optional[str] = Query(None, description="Filter by city"),
     state: Optional[str] = Query(None, description="Filter by state/region"),
     postal_code: Optional[str] = Query(None, description="Filter by postal code"),
     country: Optional[str] = Query(None, description="Filter by country"),
+    accept: Optional[str] = Header(None, description="application/x-msgpack for a MessagePack body"),
 ):
-    results = list(addresses.values())
+    candidates = index_lookup(
+        address_index,
+        {"city": city, "state": state, "postal_code": postal_code, "country": country},
+        order=address_seq,
+    )
+    keys = addresses.keys() if candidates is None else candidates
 
+    preds = []
     if street is not None:
-        results = [a for a in results if a.street == street]
-    if city is not None:
-        results = [a for a in results if a.city == city]
-    if state is not None:
-        results = [a for a in results if a.state == state]
-    if postal_code is not None:
-        results = [a for a in results if a.postal_code == postal_code]
-    if country is not None:
-        results = [a for a in results if a.country == country]
-
-    return results
+        preds.append(lambda a: a.street == street)
+
+    keys = select(addresses, keys, preds)
+    if wants_msgpack(accept):
+        return msgpack_response(addresses[k] for k in keys)
+    return json_array_response((address_json[k].body for k in keys), headers=VARY_ACCEPT)
 
 @app.get("/addresses/{address_id}", response_model=AddressRead, tags=["addresses"])
-def get_address(address_id: UUID):
-    if address_id not in addresses:
+async def get_address(
+    address_id: UUID,
+    if_none_match: Optional[str] = Header(None, description="ETag from a previous response"),
+):
+    key = address_id.int
+    if key not in addresses:
         raise HTTPException(status_code=404, detail="Address not found")
-    return addresses[address_id]
+    return rendered_response(address_json[key], if_none_match=if_none_match)
 
 @app.patch("/addresses/{address_id}", response_model=AddressRead, tags=["addresses"])
-def update_address(address_id: UUID, update: AddressUpdate):
-    if address_id not in addresses:
+async def update_address(address_id: UUID, update: AddressUpdate):
+    key = address_id.int
+    if key not in addresses:
         raise HTTPException(status_code=404, detail="Address not found")
-    stored = addresses[address_id].model_dump()
-    stored.update(update.model_dump(exclude_unset=True))
-    addresses[address_id] = AddressRead(**stored)
-    return addresses[address_id]
+    newvals = update.model_dump(exclude_unset=True)
+    if not newvals:
+        return rendered_response(address_json[key])
+    record = apply_update(addresses[key], newvals)
+    index_remove(address_index, key, address_index_keys(addresses[key]))
+    addresses[key] = record
+    address_json[key] = render_model(record)
+    index_add(address_index, key, address_index_keys(record))
+    return rendered_response(address_json[key])
 
 @app.post("/persons", response_model=PersonRead, status_code=201, tags=["persons"])
-def create_person(person: PersonCreate):
+async def create_person(person: PersonCreate):
     # Each person gets its own UUID; stored as PersonRead
     person_read = PersonRead(**person.model_dump())
-    persons[person_read.id] = person_read
-    return person_read
-
-@app.get("/persons", response_model=List[PersonRead], tags=["persons"])
-def list_persons(
+    key = person_read.id.int
+    persons[key] = person_read
+    person_seq[key] = next(_sequence)
+    person_json[key] = render_model(person_read)
+    index_add(person_index, key, person_index_keys(person_read))
+    return rendered_response(person_json[key], status_code=201)
+
+@app.get("/persons", responses={200: {"model": List[PersonRead], "content": {"application/x-msgpack": {}}}}, tags=["persons"])
+async def list_persons(
     uni: Optional[str] = Query(None, description="Filter by Columbia UNI"),
     first_name: Optional[str] = Query(None, description="Filter by first name"),
     last_name: Optional[str] = Query(None, description="Filter by last name"),
@@ -115,156 +227,218 @@ def list_persons(
     birth_date: Optional[str] = Query(None, description="Filter by date of birth (YYYY-MM-DD)"),
     city: Optional[str] = Query(None, description="Filter by city of at least one address"),
     country: Optional[str] = Query(None, description="Filter by country of at least one address"),
+    accept: Optional[str] = Header(None, description="application/x-msgpack for a MessagePack body"),
 ):
-    results = list(persons.values())
+    candidates = index_lookup(
+        person_index,
+        {"uni": uni, "email": email, "city": city, "country": country},
+        order=person_seq,
+    )
+    keys = persons.keys() if candidates is None else candidates
 
-    if uni is not None:
-        results = [p for p in results if p.uni == uni]
+    preds = []
     if first_name is not None:
-        results = [p for p in results if p.first_name == first_name]
+        preds.append(lambda p: p.first_name == first_name)
     if last_name is not None:
-        results = [p for p in results if p.last_name == last_name]
-    if email is not None:
-        results = [p for p in results if p.email == email]
+        preds.append(lambda p: p.last_name == last_name)
     if phone is not None:
-        results = [p for p in results if p.phone == phone]
+        preds.append(lambda p: p.phone == phone)
     if birth_date is not None:
-        results = [p for p in results if str(p.birth_date) == birth_date]
-
-    
-    if city is not None:
-        results = [p for p in results if any(addr.city == city for addr in p.addresses)]
-    if country is not None:
-        results = [p for p in results if any(addr.country == country for addr in p.addresses)]
+        preds.append(lambda p: str(p.birth_date) == birth_date)
 
-    return results
+    keys = select(persons, keys, preds)
+    if wants_msgpack(accept):
+        return msgpack_response(persons[k] for k in keys)
+    return json_array_response((person_json[k].body for k in keys), headers=VARY_ACCEPT)
 
 @app.get("/persons/{person_id}", response_model=PersonRead, tags=["persons"])
-def get_person(person_id: UUID):
-    if person_id not in persons:
+async def get_person(
+    person_id: UUID,
+    if_none_match: Optional[str] = Header(None, description="ETag from a previous response"),
+):
+    key = person_id.int
+    if key not in persons:
         raise HTTPException(status_code=404, detail="Person not found")
-    return persons[person_id]
+    return rendered_response(person_json[key], if_none_match=if_none_match)
 
 @app.patch("/persons/{person_id}", response_model=PersonRead, tags=["persons"])
-def update_person(person_id: UUID, update: PersonUpdate):
-    if person_id not in persons:
+async def update_person(person_id: UUID, update: PersonUpdate):
+    key = person_id.int
+    if key not in persons:
         raise HTTPException(status_code=404, detail="Person not found")
-    stored = persons[person_id].model_dump()
-    stored.update(update.model_dump(exclude_unset=True))
-    persons[person_id] = PersonRead(**stored)
-    return persons[person_id]
+    newvals = update.model_dump(exclude_unset=True)
+    if not newvals:
+        return rendered_response(person_json[key])
+    record = apply_update(persons[key], newvals)
+    index_remove(person_index, key, person_index_keys(persons[key]))
+    persons[key] = record
+    person_json[key] = render_model(record)
+    index_add(person_index, key, person_index_keys(record))
+    return rendered_response(person_json[key])
 
 
 @app.post("/courses", response_model=CourseRead, status_code=201, tags=["courses"])
-def create_course(course: CourseCreate):
+async def create_course(course: CourseCreate):
     # simple uniqueness check: (code, semester) 
-    if any(c.code == course.code and c.semester == course.semester for c in courses.values()):
+    if (course.code, course.semester) in course_unique:
         raise HTTPException(status_code=409, detail="Course already exists for this semester")
 
-    data = course.model_dump()
-    data["created_at"] = datetime.utcnow()
-    data["updated_at"] = data["created_at"]
-
-    record = CourseRead(**data)
-    courses[record.id] = record
-    return record
-
-@app.get("/courses", response_model=List[CourseRead], tags=["courses"])
-def list_courses(
+    # the payload is already validated, so build the stored record without revalidating
+    now = datetime.utcnow()
+    record = CourseRead.model_construct(**course.model_dump(), created_at=now, updated_at=now)
+    key = record.id.int
+    courses[key] = record
+    course_json[key] = render_model(record)
+    course_seq[key] = next(_sequence)
+    course_unique[(record.code, record.semester)] = key
+    index_add(course_index, key, course_index_keys(record))
+    return rendered_response(course_json[key], status_code=201)
+
+@app.get("/courses", responses={200: {"model": List[CourseRead], "content": {"application/x-msgpack": {}}}}, tags=["courses"])
+async def list_courses(
     code: Optional[str] = Query(None, description="Filter by course code"),
     semester: Optional[str] = Query(None, description="Filter by semester"),
     instructor: Optional[str] = Query(None, description="Filter by instructor"),
+    accept: Optional[str] = Header(None, description="application/x-msgpack for a MessagePack body"),
 ):
-    result = list(courses.values())
-    if code is not None:
-        result = [c for c in result if c.code == code]
-    if semester is not None:
-        result = [c for c in result if c.semester == semester]
-    if instructor is not None:
-        result = [c for c in result if c.instructor == instructor]
-    return result
+    candidates = index_lookup(
+        course_index,
+        {"code": code, "semester": semester, "instructor": instructor},
+        order=course_seq,
+    )
+    keys = courses.keys() if candidates is None else candidates
+    if wants_msgpack(accept):
+        return msgpack_response(courses[k] for k in keys)
+    return json_array_response((course_json[k].body for k in keys), headers=VARY_ACCEPT)
 
 @app.get("/courses/{course_id}", response_model=CourseRead, tags=["courses"])
-def get_course(course_id: UUID):
-    if course_id not in courses:
+async def get_course(
+    course_id: UUID,
+    if_none_match: Optional[str] = Header(None, description="ETag from a previous response"),
+):
+    key = course_id.int
+    if key not in courses:
         raise HTTPException(status_code=404, detail="Course not found")
-    return courses[course_id]
+    return rendered_response(course_json[key], if_none_match=if_none_match)
 
 @app.patch("/courses/{course_id}", response_model=CourseRead, tags=["courses"])
-def update_course(course_id: UUID, update: CourseUpdate):
-    if course_id not in courses:
+async def update_course(course_id: UUID, update: CourseUpdate):
+    key = course_id.int
+    if key not in courses:
         raise HTTPException(status_code=404, detail="Course not found")
-    stored = courses[course_id].model_dump()
+    stored = courses[key]
     newvals = update.model_dump(exclude_unset=True)
+    if not newvals:
+        return rendered_response(course_json[key])
     # if code/semester change, check for uniqueness
-    new_code = newvals.get("code", stored["code"])
-    new_sem = newvals.get("semester", stored["semester"])
-    if any(c.id != course_id and c.code == new_code and c.semester == new_sem for c in courses.values()):
+    old_pair = (stored.code, stored.semester)
+    new_pair = (newvals.get("code", stored.code), newvals.get("semester", stored.semester))
+    if new_pair != old_pair and new_pair in course_unique:
         raise HTTPException(status_code=409, detail="Course already exists for this semester")
-    stored.update(newvals)
-    stored["updated_at"] = datetime.utcnow()
-    courses[course_id] = CourseRead(**stored)
-    return courses[course_id]
+    newvals["updated_at"] = datetime.utcnow()
+    record = apply_update(stored, newvals)
+    if new_pair != old_pair:
+        del course_unique[old_pair]
+        course_unique[new_pair] = key
+    index_remove(course_index, key, course_index_keys(stored))
+    courses[key] = record
+    course_json[key] = render_model(record)
+    index_add(course_index, key, course_index_keys(record))
+    return rendered_response(course_json[key])
 
 @app.delete("/courses/{course_id}", status_code=204, tags=["courses"])
-def delete_course(course_id: UUID):
-    if course_id not in courses:
+async def delete_course(course_id: UUID):
+    key = course_id.int
+    if key not in courses:
         raise HTTPException(status_code=404, detail="Course not found")
     # cascade: delete assignments for this course
-    for aid in [aid for aid, a in assignments.items() if a.course_id == course_id]:
+    for aid in assignments_by_course.pop(key, ()):
         del assignments[aid]
-    del courses[course_id]
+        del assignment_json[aid]
+        del assignment_seq[aid]
+    course = courses.pop(key)
+    del course_json[key]
+    del course_seq[key]
+    del course_unique[(course.code, course.semester)]
+    index_remove(course_index, key, course_index_keys(course))
 
 
 @app.post("/assignments", response_model=AssignmentRead, status_code=201, tags=["assignments"])
-def create_assignment(assignment: AssignmentCreate):
-    if assignment.course_id not in courses:
+async def create_assignment(assignment: AssignmentCreate):
+    if assignment.course_id.int not in courses:
         raise HTTPException(status_code=400, detail="course_id must refer to an existing course")
-    data = assignment.model_dump()
-    data["created_at"] = datetime.utcnow()
-    data["updated_at"] = data["created_at"]
-    record = AssignmentRead(**data)      # id is generated here
-    assignments[record.id] = record      # storing the generated id
-    return record
-
-@app.get("/assignments", response_model=List[AssignmentRead], tags=["assignments"])
-def list_assignments(course_id: Optional[UUID] = Query(None, description="Filter by course_id")):
-    result = list(assignments.values())
-    if course_id is not None:
-        result = [a for a in result if a.course_id == course_id]
-    return result
+    now = datetime.utcnow()
+    record = AssignmentRead.model_construct(**assignment.model_dump(), created_at=now, updated_at=now)  # id is generated here
+    key = record.id.int
+    assignments[key] = record      # storing the generated id
+    assignment_json[key] = render_model(record)
+    assignment_seq[key] = next(_sequence)
+    assignments_by_course[record.course_id.int].add(key)
+    return rendered_response(assignment_json[key], status_code=201)
+
+@app.get("/assignments", responses={200: {"model": List[AssignmentRead], "content": {"application/x-msgpack": {}}}}, tags=["assignments"])
+async def list_assignments(
+    course_id: Optional[UUID] = Query(None, description="Filter by course_id"),
+    accept: Optional[str] = Header(None, description="application/x-msgpack for a MessagePack body"),
+):
+    if course_id is None:
+        keys = assignments.keys()
+    else:
+        keys = sorted(assignments_by_course.get(course_id.int, ()), key=assignment_seq.__getitem__)
+    if wants_msgpack(accept):
+        return msgpack_response(assignments[k] for k in keys)
+    return json_array_response((assignment_json[k].body for k in keys), headers=VARY_ACCEPT)
 
 @app.get("/assignments/{assignment_id}", response_model=AssignmentRead, tags=["assignments"])
-def get_assignment(assignment_id: UUID):
-    if assignment_id not in assignments:
+async def get_assignment(
+    assignment_id: UUID,
+    if_none_match: Optional[str] = Header(None, description="ETag from a previous response"),
+):
+    key = assignment_id.int
+    if key not in assignments:
         raise HTTPException(status_code=404, detail="Assignment not found")
-    return assignments[assignment_id]
+    return rendered_response(assignment_json[key], if_none_match=if_none_match)
 
 @app.patch("/assignments/{assignment_id}", response_model=AssignmentRead, tags=["assignments"])
-def update_assignment(assignment_id: UUID, update: AssignmentUpdate):
-    if assignment_id not in assignments:
+async def update_assignment(assignment_id: UUID, update: AssignmentUpdate):
+    key = assignment_id.int
+    if key not in assignments:
         raise HTTPException(status_code=404, detail="Assignment not found")
-    stored = assignments[assignment_id].model_dump()
     newvals = update.model_dump(exclude_unset=True)
-    
-    if "course_id" in newvals and newvals["course_id"] not in courses:
-        raise HTTPException(status_code=400, detail="course_id must refer to an existing course")
-    stored.update(newvals)
-    stored["updated_at"] = datetime.utcnow()
-    assignments[assignment_id] = AssignmentRead(**stored)
-    return assignments[assignment_id]
+    if not newvals:
+        return rendered_response(assignment_json[key])
+
+    if "course_id" in newvals:
+        new_course_id = newvals["course_id"]
+        if new_course_id is None or new_course_id.int not in courses:
+            raise HTTPException(status_code=400, detail="course_id must refer to an existing course")
+    newvals["updated_at"] = datetime.utcnow()
+    record = apply_update(assignments[key], newvals)
+    old_course_key = assignments[key].course_id.int
+    if record.course_id.int != old_course_key:
+        assignments_by_course[old_course_key].discard(key)
+        assignments_by_course[record.course_id.int].add(key)
+    assignments[key] = record
+    assignment_json[key] = render_model(record)
+    return rendered_response(assignment_json[key])
 
 @app.delete("/assignments/{assignment_id}", status_code=204, tags=["assignments"])
-def delete_assignment(assignment_id: UUID):
-    if assignment_id not in assignments:
+async def delete_assignment(assignment_id: UUID):
+    key = assignment_id.int
+    if key not in assignments:
         raise HTTPException(status_code=404, detail="Assignment not found")
-    del assignments[assignment_id]
+    assignment = assignments.pop(key)
+    del assignment_json[key]
+    del assignment_seq[key]
+    assignments_by_course[assignment.course_id.int].discard(key)
+
+_ROOT_BYTES = orjson.dumps({
+    "message": "Welcome to the Person/Address/Course/Assignment API. See /docs for OpenAPI UI."
+})
 
 @app.get("/", tags=["root"])
-def root():
-    return {
-        "message": "Welcome to the Person/Address/Course/Assignment API. See /docs for OpenAPI UI."
-    }
+async def root():
+    return Response(content=_ROOT_BYTES, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,42 @@
+from collections import defaultdict
+from typing import Any, DefaultDict, Dict, Hashable, Iterable, List, Mapping, Optional, Set
+
+# field name -> field value -> ids of the records holding that value
+Index = Dict[str, DefaultDict[Hashable, Set[Any]]]
+
+
+def make_index(*fields: str) -> Index:
+    return {field: defaultdict(set) for field in fields}
+
+
+def index_add(index: Index, record_id: Any, keys: Mapping[str, Iterable[Hashable]]) -> None:
+    for field, values in keys.items():
+        for value in values:
+            index[field][value].add(record_id)
+
+
+def index_remove(index: Index, record_id: Any, keys: Mapping[str, Iterable[Hashable]]) -> None:
+    for field, values in keys.items():
+        by_value = index[field]
+        for value in values:
+            ids = by_value.get(value)
+            if ids is None:
+                continue
+            ids.discard(record_id)
+            if not ids:
+                del by_value[value]
+
+
+def index_lookup(
+    index: Index, filters: Mapping[str, Optional[Hashable]], order: Mapping[Any, int]
+) -> Optional[List[Any]]:
+    """Intersect the id sets for every non-None filter; None means no indexed filter was given.
+
+    Hits are sorted by order (id -> creation sequence) so they list like the insertion-ordered stores.
+    """
+    matches = [index[field].get(value, set()) for field, value in filters.items() if value is not None]
+    if not matches:
+        return None
+    matches.sort(key=len)
+    hits = matches[0].intersection(*matches[1:])
+    return sorted(hits, key=order.__getitem__)
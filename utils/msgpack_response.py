@@ -0,0 +1,52 @@
+from typing import Iterable, Optional, Tuple
+
+import ormsgpack
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+MSGPACK_MEDIA_TYPES = ("application/x-msgpack", "application/msgpack")
+
+# list routes pick JSON or MessagePack from Accept, so caches must key on it
+VARY_ACCEPT = {"Vary": "Accept"}
+
+
+def _media_ranges(accept: str) -> Iterable[Tuple[str, float]]:
+    """Yield (media range, q) pairs from an Accept header; malformed q-values count as 0."""
+    for part in accept.split(","):
+        media_range, *params = part.split(";")
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        yield media_range.strip().lower(), q
+
+
+def _json_quality(ranges: Iterable[Tuple[str, float]]) -> float:
+    """q for application/json, taken from the most specific matching range as RFC 9110 requires."""
+    by_specificity = {"application/json": None, "application/*": None, "*/*": None}
+    for media_range, q in ranges:
+        if media_range in by_specificity and by_specificity[media_range] is None:
+            by_specificity[media_range] = q
+    return next((q for q in by_specificity.values() if q is not None), 0.0)
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    """True if Accept names a MessagePack type with q > 0 and rates it at least as high as JSON."""
+    if not accept:
+        return False
+    ranges = list(_media_ranges(accept))
+    msgpack_q = max((q for media_range, q in ranges if media_range in MSGPACK_MEDIA_TYPES), default=0.0)
+    return msgpack_q > 0 and msgpack_q >= _json_quality(ranges)
+
+
+def msgpack_response(models: Iterable[BaseModel]) -> Response:
+    """Encode models as a MessagePack array; UUIDs and datetimes get the same string forms as JSON."""
+    return Response(
+        content=ormsgpack.packb([m.model_dump() for m in models]),
+        media_type=MSGPACK_MEDIA_TYPES[0],
+        headers=VARY_ACCEPT,
+    )
@@ -0,0 +1,57 @@
+from hashlib import blake2b
+from typing import Any, Iterable, Mapping, NamedTuple, Optional
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (native UUID/datetime/date support)."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+class Rendered(NamedTuple):
+    """A record's JSON body plus the strong ETag derived from it."""
+    body: bytes
+    etag: str
+
+
+def render_model(model: BaseModel) -> Rendered:
+    """Encode an already-validated model to JSON bytes once, so reads can reuse them."""
+    body = orjson.dumps(model.model_dump())
+    return Rendered(body, '"%s"' % blake2b(body, digest_size=16).hexdigest())
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """RFC 9110 weak comparison of an If-None-Match header against our ETag."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def json_response(
+    body: bytes, status_code: int = 200, headers: Optional[Mapping[str, str]] = None
+) -> Response:
+    """Return pre-rendered JSON; response_model stays on the route for the docs only."""
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def rendered_response(
+    rendered: Rendered, status_code: int = 200, if_none_match: Optional[str] = None
+) -> Response:
+    """Serve a rendered record with its ETag, or a bodiless 304 if the client already has it."""
+    headers = {"ETag": rendered.etag}
+    if if_none_match is not None and etag_matches(if_none_match, rendered.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=rendered.body, status_code=status_code, media_type="application/json", headers=headers
+    )
+
+
+def json_array_response(bodies: Iterable[bytes], headers: Optional[Mapping[str, str]] = None) -> Response:
+    """Splice pre-rendered JSON objects into a JSON array without decoding them."""
+    return json_response(b"[" + b",".join(bodies) + b"]", headers=headers)